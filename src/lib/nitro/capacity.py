@@ -0,0 +1,230 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+from rich import print
+from rich.table import Table
+from lib.nitro.factory import ActionFactory
+from lib.nitro.metrics import percentile
+from lib.nitro.stages import StageFactory
+
+
+class SLO:
+    """
+    Service level objective a load step has to meet to be considered sustainable.
+    """
+    def __init__(self, p99_latency_ms: float = None, max_error_rate: float = 0.01):
+        """
+        :param p99_latency_ms: Maximum allowed p99 latency in milliseconds, None to ignore latency.
+        :param max_error_rate: Maximum allowed fraction of failed actions (0.0 - 1.0).
+        """
+        self.p99_latency_ms = p99_latency_ms
+        self.max_error_rate = max_error_rate
+
+    def is_met(self, step: Dict[str, Any]) -> bool:
+        """
+        Checks whether the measurements of a load step satisfy the SLO.
+        :param step: A step result as produced by CapacitySearch.run_step.
+        :return: True if the step is within the SLO.
+        """
+        if step['requests'] == 0:
+            return False
+        if self.max_error_rate is not None and step['error_rate'] > self.max_error_rate:
+            return False
+        if self.p99_latency_ms is not None and step['p99_ms'] > self.p99_latency_ms:
+            return False
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'p99_latency_ms': self.p99_latency_ms, 'max_error_rate': self.max_error_rate}
+
+
+class CapacitySearch:
+    """
+    Finds the maximum sustainable concurrency of a stage by ramping up load until the SLO breaks,
+    then binary searching between the last passing and the first failing level.
+    """
+    def __init__(self, stage_name: str, slo: SLO, testcase_params: Dict[str, Any] = None,
+                 mode: str = "binary", min_concurrency: int = 1, max_concurrency: int = 256,
+                 step_levels: List[int] = None, step_duration: float = 10.0, warmup: float = 2.0,
+                 resolution: int = 1, saturation_tolerance: float = 0.05):
+        """
+        :param stage_name: Name of a registered stage whose action is used to generate load (e.g. 'http_get').
+        :param slo: The SLO every step is checked against.
+        :param testcase_params: Parameters used to build the stage.
+        :param mode: "binary" to ramp exponentially then bisect, "step" to walk through step_levels in order.
+        :param min_concurrency: First concurrency level tried.
+        :param max_concurrency: Upper bound for the concurrency.
+        :param step_levels: Explicit concurrency levels for "step" mode, defaults to powers of two.
+        :param step_duration: Measured seconds per step.
+        :param warmup: Seconds at the start of each step that are excluded from the measurements.
+        :param resolution: Binary search stops when the pass/fail bracket is this narrow.
+        :param saturation_tolerance: A step within this fraction of the peak throughput counts as saturated.
+        """
+        if mode not in ("binary", "step"):
+            raise ValueError(f"Unknown capacity search mode: {mode}")
+        self.stage_name = stage_name
+        self.slo = slo
+        self.testcase_params = testcase_params or {}
+        self.mode = mode
+        self.min_concurrency = max(min_concurrency, 1)
+        self.max_concurrency = max(max_concurrency, self.min_concurrency)
+        self.step_levels = step_levels
+        self.step_duration = step_duration
+        self.warmup = warmup
+        self.resolution = max(resolution, 1)
+        self.saturation_tolerance = saturation_tolerance
+        self._steps: Dict[int, Dict[str, Any]] = {}
+
+    def _resolve_action(self):
+        stage = StageFactory.create_stage(self.stage_name, self.testcase_params)
+        if stage is None:
+            raise ValueError(f"Stage '{self.stage_name}' not found.")
+        action = ActionFactory.create_action(stage.action)
+        if action is None:
+            raise ValueError(f"Unknown action: {stage.action}")
+        params = dict(stage.params)
+        params['quiet'] = True  # Per-call logging would dominate the measurements
+        return action, params
+
+    def _worker(self, action, params: Dict[str, Any], measure_start: float, deadline: float):
+        latencies, errors = [], 0
+        while True:
+            started = time.perf_counter()
+            if started >= deadline:
+                break
+            try:
+                ok = bool(action.execute(params))
+            except Exception:
+                ok = False
+            if started >= measure_start:
+                latencies.append(time.perf_counter() - started)
+                if not ok:
+                    errors += 1
+        return latencies, errors
+
+    def run_step(self, concurrency: int) -> Dict[str, Any]:
+        """
+        Drives the stage action with a fixed number of closed-loop workers and measures the outcome.
+        :param concurrency: Number of concurrent workers.
+        :return: A dictionary with throughput, latency percentiles and error rate of the step.
+        """
+        if concurrency in self._steps:
+            return self._steps[concurrency]
+        action, params = self._resolve_action()
+        print(f"[bold yellow]*=============* Capacity step: {self.stage_name} at concurrency {concurrency}[/bold yellow]")
+        measure_start = time.perf_counter() + self.warmup
+        deadline = measure_start + self.step_duration
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(self._worker, action, params, measure_start, deadline) for _ in range(concurrency)]
+            outcomes = [future.result() for future in futures]
+        # Requests started before the deadline may finish after it, so divide by the time actually measured
+        elapsed = time.perf_counter() - measure_start
+
+        latencies = sorted(lat for worker_latencies, _ in outcomes for lat in worker_latencies)
+        errors = sum(worker_errors for _, worker_errors in outcomes)
+        requests_done = len(latencies)
+        step = {
+            'concurrency': concurrency,
+            'requests': requests_done,
+            'errors': errors,
+            'error_rate': errors / requests_done if requests_done else 1.0,
+            'throughput': requests_done / elapsed,
+            'p50_ms': (percentile(latencies, 50) or 0.0) * 1000,
+            'p90_ms': (percentile(latencies, 90) or 0.0) * 1000,
+            'p99_ms': (percentile(latencies, 99) or 0.0) * 1000,
+        }
+        step['slo_met'] = self.slo.is_met(step)
+        self._steps[concurrency] = step
+        return step
+
+    def _binary_search(self) -> None:
+        passed, failed = None, None
+        level = self.min_concurrency
+        while True:
+            if self.run_step(level)['slo_met']:
+                passed = level
+                if level >= self.max_concurrency:
+                    return
+                level = min(level * 2, self.max_concurrency)
+            else:
+                failed = level
+                break
+        if passed is None:
+            return
+        while failed - passed > self.resolution:
+            middle = (passed + failed) // 2
+            if self.run_step(middle)['slo_met']:
+                passed = middle
+            else:
+                failed = middle
+
+    def _step_search(self) -> None:
+        if self.step_levels:
+            levels = sorted({min(max(level, 1), self.max_concurrency) for level in self.step_levels})
+        else:
+            levels, level = [], self.min_concurrency
+            while level < self.max_concurrency:
+                levels.append(level)
+                level *= 2
+            levels.append(self.max_concurrency)
+        for level in levels:
+            if not self.run_step(level)['slo_met']:
+                break
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Runs the capacity search.
+        :return: A dictionary with the highest step meeting the SLO ('max_sustainable', or None),
+                 the knee point where throughput stops rising ('knee') and the throughput/latency
+                 curve ordered by concurrency.
+        """
+        self._steps = {}
+        if self.mode == "binary":
+            self._binary_search()
+        else:
+            self._step_search()
+        curve = [self._steps[level] for level in sorted(self._steps)]
+        passing = [step for step in curve if step['slo_met']]
+        max_sustainable = max(passing, key=lambda step: step['concurrency']) if passing else None
+        summary = {'stage': self.stage_name, 'slo': self.slo.to_dict(), 'max_sustainable': max_sustainable,
+                   'knee': self._knee(curve), 'curve': curve}
+        print_capacity_report(summary)
+        return summary
+
+    def _knee(self, curve: List[Dict[str, Any]]):
+        # The lowest concurrency that already reaches (almost) the peak throughput; adding workers
+        # beyond it only adds queueing latency.
+        if not curve:
+            return None
+        peak = max(step['throughput'] for step in curve)
+        return next(step for step in curve if step['throughput'] >= (1 - self.saturation_tolerance) * peak)
+
+
+def print_capacity_report(summary: Dict[str, Any]) -> None:
+    """
+    Prints the throughput/latency curve, the knee point and the maximum sustainable load of a capacity search.
+    """
+    table = Table(title=f"Capacity search: {summary['stage']}")
+    for column in ("Concurrency", "Throughput (req/s)", "p50 (ms)", "p90 (ms)", "p99 (ms)", "Error rate", "SLO"):
+        table.add_column(column, justify="right")
+    for step in summary['curve']:
+        table.add_row(
+            str(step['concurrency']),
+            f"{step['throughput']:.1f}",
+            f"{step['p50_ms']:.1f}",
+            f"{step['p90_ms']:.1f}",
+            f"{step['p99_ms']:.1f}",
+            f"{step['error_rate']:.2%}",
+            "[green]met[/green]" if step['slo_met'] else "[red]breached[/red]",
+        )
+    print(table)
+    knee = summary['knee']
+    if knee:
+        print(f"[bold yellow]Knee point (throughput saturates): concurrency {knee['concurrency']} at "
+              f"{knee['throughput']:.1f} req/s (p99 {knee['p99_ms']:.1f} ms)[/bold yellow]")
+    max_sustainable = summary['max_sustainable']
+    if max_sustainable:
+        print(f"[bold green]Maximum sustainable load within the SLO: concurrency {max_sustainable['concurrency']} at "
+              f"{max_sustainable['throughput']:.1f} req/s (p99 {max_sustainable['p99_ms']:.1f} ms)[/bold green]")
+    else:
+        print("[bold red]No load level met the SLO.[/bold red]")
@@ -1,5 +1,7 @@
 from typing import Dict, Optional
 from lib.nitro.strategy import ActionStrategy, HttpAction, FileReadAction, SleepAction, RecoveryAction
+from lib.nitro.replay import ReplayAction
+from lib.nitro.reporting import GraphAction, ReportAction
 from lib.nitro.probes import ProbeStrategy, MetricsProbe, LoggingProbe, DebugProbe
 
 def get_probes(probe_names: list) -> list:
@@ -19,7 +21,10 @@ class ActionFactory:
         'http': HttpAction(),
         'file_read': FileReadAction(),
         'sleep': SleepAction(),
-        'recovery': RecoveryAction()
+        'recovery': RecoveryAction(),
+        'replay': ReplayAction(),
+        'graph': GraphAction(),
+        'generate_report': ReportAction()
     }
 
     @staticmethod
@@ -0,0 +1,55 @@
+import math
+from typing import List, Optional
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """
+    Returns the nearest-rank percentile of an already sorted list of values.
+    """
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class LatencyHistogram:
+    """
+    Fixed-size histogram with logarithmic buckets for percentiles over unbounded streams of latencies.
+    Memory does not grow with the number of samples; percentiles are accurate to the relative precision.
+    """
+    def __init__(self, min_value: float = 1e-6, max_value: float = 3600.0, precision: float = 0.01):
+        """
+        :param min_value: Smallest distinguishable latency in seconds, smaller values land in the first bucket.
+        :param max_value: Largest distinguishable latency in seconds, larger values land in the last bucket.
+        :param precision: Relative width of a bucket (0.01 keeps percentiles within 1%).
+        """
+        self.min_value = min_value
+        self._log_base = math.log1p(precision)
+        self._counts = [0] * (self._bucket(max_value) + 1)
+        self.count = 0
+        self.max = 0.0
+
+    def _bucket(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        return int(math.log(value / self.min_value) / self._log_base) + 1
+
+    def add(self, value: float) -> None:
+        self._counts[min(self._bucket(value), len(self._counts) - 1)] += 1
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """
+        Returns the nearest-rank percentile, reported as the upper bound of its bucket.
+        """
+        if not self.count:
+            return None
+        rank = max(math.ceil(pct / 100.0 * self.count), 1)
+        seen = 0
+        for bucket, bucket_count in enumerate(self._counts):
+            seen += bucket_count
+            if seen >= rank:
+                upper = self.min_value * math.exp(bucket * self._log_base)
+                return min(upper, self.max)
+        return self.max
@@ -1,3 +1,4 @@
+import time
 from rich import print
 from typing import List, Any, Dict
 from lib.nitro.factory import ActionFactory
@@ -12,6 +13,7 @@ class TestOrchestrator:
         self._subject.attach(TestProgressObserver())
         self._testcase_params = testcase_params or {}
         self._stage_results: Dict[str, Any] = {}
+        self._stage_records: List[Dict[str, Any]] = []  # Stage dictionaries, including timings, in execution order
 
     def execute_test(self) -> List[Any]:
         stages = get_stages(self._stage_names, self._testcase_params)
@@ -35,6 +37,7 @@ class TestOrchestrator:
                 stage.set_state("skipped")
                 results.append(f"Skipped: Dependency not met for {stage.name}")
                 self._stage_results[stage.name] = f"Skipped: Dependency not met for {stage.name}"
+                self._stage_records.append(stage.to_dict())
                 continue
 
             action_type = stage.action
@@ -46,8 +49,15 @@ class TestOrchestrator:
 
             if action:
                 self._subject.notify(f"Executing action: {action_type} with params: {params}")
+                if action.requires_history:
+                    params = {**params, 'stage_records': list(self._stage_records)}
+                stage.start_time = time.time()
                 try:
-                    result = action.execute(params)
+                    try:
+                        result = action.execute(params)
+                    finally:
+                        stage.end_time = time.time()
+                        stage.duration = stage.end_time - stage.start_time
                     print("[bold green]Action result: [/bold green]", result)
                     if not result: # Simulate failure if the action returns False
                         # Log the result and notify observers
@@ -66,6 +76,7 @@ class TestOrchestrator:
                     stage.set_state("completed") # Set state to "completed" after successful execution
                     stage.result = result
                     self._stage_results[stage.name] = result
+                    self._stage_records.append(stage.to_dict())
                 except Exception as e:
                     # Log the failure and raise an exception to fail the test case
                     self._subject.notify(f"[bold red] Action {action_type} failed with error: {str(e)} [/bold red]")
@@ -73,6 +84,7 @@ class TestOrchestrator:
                     stage.error = str(e)
                     self._stage_results[stage.name] = f"Failed: {str(e)}"
                     results.append(f"Failed: {str(e)}")
+                    self._stage_records.append(stage.to_dict())
                     raise RuntimeError(f"Stage '{stage.name}' failed: {str(e)}")
             else:
                 results.append(f"Unknown action: {action_type}")
@@ -80,6 +92,7 @@ class TestOrchestrator:
                 stage.set_state("unknown") # Set state to "unknown" if action is not found
                 stage.error = f"Unknown action: {action_type}"
                 self._stage_results[stage.name] = f"Unknown action: {action_type}"
+                self._stage_records.append(stage.to_dict())
         return results
         # Notify observers about the completion of all actions
         # self._subject.notify("All actions executed.")
\ No newline at end of file
@@ -0,0 +1,244 @@
+import gzip
+import json
+import math
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Any, Dict, Iterator, Optional
+from urllib.parse import urlsplit
+from rich import print
+import requests
+from lib.nitro.metrics import LatencyHistogram
+from lib.nitro.samples import SampleWriter
+from lib.nitro.strategy import ActionStrategy
+
+# Common/combined access log line, e.g.
+# 127.0.0.1 - - [10/Oct/2000:13:55:36 -0700] "GET /apache_pb.gif HTTP/1.0" 200 2326
+ACCESS_LOG_PATTERN = re.compile(r'^\S+ \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<method>[A-Z]+) (?P<path>\S+)[^"]*"')
+ACCESS_LOG_TIME_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+
+
+def _open_log(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    return open(path, 'r')
+
+
+# Seconds per unit of numeric timestamps
+TIMESTAMP_UNITS = {'s': 1.0, 'ms': 1e-3, 'us': 1e-6, 'ns': 1e-9}
+# Epoch seconds from about the year 5138 on are not plausible; larger values are finer units
+MAX_TIMESTAMP = 1e11
+
+
+def _detect_unit(value: float) -> str:
+    for unit, threshold in (('ns', MAX_TIMESTAMP * 1e6), ('us', MAX_TIMESTAMP * 1e3), ('ms', MAX_TIMESTAMP)):
+        if abs(value) >= threshold:
+            return unit
+    return 's'
+
+
+def _parse_timestamp(value, timestamp_unit: str = None) -> float:
+    if isinstance(value, (int, float)):
+        timestamp = float(value) * TIMESTAMP_UNITS[timestamp_unit or _detect_unit(float(value))]
+    else:
+        timestamp = datetime.fromisoformat(value).timestamp()
+    if not math.isfinite(timestamp) or not 0 <= timestamp < MAX_TIMESTAMP:
+        raise ValueError(f"Timestamp out of range: {value}")
+    return timestamp
+
+
+def parse_jsonl_record(line: str, timestamp_unit: str = None) -> Optional[Dict[str, Any]]:
+    """
+    Parses one JSONL request record with a timestamp ('timestamp', 'ts' or 'time', numeric or ISO 8601),
+    'method', 'url' or 'path', and optional 'headers' (an object) and 'body' (a string or an object).
+    :param line: The JSON line.
+    :param timestamp_unit: Unit of numeric timestamps ("s", "ms", "us" or "ns"). If not given, epoch
+                           timestamps too large for seconds are read as ms, us or ns; relative timestamps
+                           in a unit other than seconds need the unit.
+    """
+    entry = json.loads(line)
+    if not isinstance(entry, dict):
+        return None
+    timestamp = entry.get('timestamp', entry.get('ts', entry.get('time')))
+    method = entry.get('method', 'GET')
+    url = entry.get('url') or entry.get('path', '/')
+    headers = entry.get('headers')
+    body = entry.get('body')
+    if not isinstance(timestamp, (int, float, str)) or isinstance(timestamp, bool):
+        return None
+    if not isinstance(method, str) or not isinstance(url, str):
+        return None
+    if headers is not None and not isinstance(headers, dict):
+        return None
+    if body is not None and not isinstance(body, (str, dict)):
+        return None
+    return {
+        'timestamp': _parse_timestamp(timestamp, timestamp_unit),
+        'method': method.upper(),
+        'url': url,
+        'headers': headers,
+        'body': body,
+    }
+
+
+def parse_access_log_record(line: str) -> Optional[Dict[str, Any]]:
+    """
+    Parses one line of a common or combined format access log.
+    """
+    match = ACCESS_LOG_PATTERN.match(line)
+    if not match:
+        return None
+    return {
+        'timestamp': datetime.strptime(match.group('time'), ACCESS_LOG_TIME_FORMAT).timestamp(),
+        'method': match.group('method'),
+        'url': match.group('path'),
+        'headers': None,
+        'body': None,
+    }
+
+
+def iter_records(path: str, log_format: str = None, timestamp_unit: str = None) -> Iterator[Dict[str, Any]]:
+    """
+    Streams request records from a recorded log one line at a time, so logs of any size can be replayed.
+    :param path: Path of the log, optionally gzip compressed (.gz).
+    :param log_format: "jsonl" or "access_log", guessed from the file extension if not given.
+    :param timestamp_unit: Unit of numeric JSONL timestamps, see parse_jsonl_record.
+    :return: An iterator of request records. Malformed lines and lines with implausible timestamps are skipped.
+    """
+    if log_format is None:
+        log_format = "jsonl" if path.replace('.gz', '').endswith(('.jsonl', '.json')) else "access_log"
+    if timestamp_unit is not None and timestamp_unit not in TIMESTAMP_UNITS:
+        raise ValueError(f"Unknown timestamp unit: {timestamp_unit}")
+    parsers = {'jsonl': partial(parse_jsonl_record, timestamp_unit=timestamp_unit), 'access_log': parse_access_log_record}
+    if log_format not in parsers:
+        raise ValueError(f"Unknown replay log format: {log_format}")
+    parse = parsers[log_format]
+    skipped = 0
+    with _open_log(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = parse(line)
+            except (ValueError, TypeError, AttributeError, KeyError):
+                # One bad line must not abort a replay of a multi-GB log
+                record = None
+            if record is None:
+                skipped += 1
+                continue
+            yield record
+    if skipped:
+        print(f"[bold yellow]Skipped {skipped} malformed lines in {path}[/bold yellow]")
+
+
+def replay_url(base_url: Optional[str], url: str) -> str:
+    """
+    Returns the URL a recorded request is replayed to: its path and query appended to base_url,
+    keeping any path prefix of base_url (e.g. a gateway mounted under /api), or the recorded URL as is.
+    """
+    if not base_url:
+        return url
+    parts = urlsplit(url)
+    return base_url.rstrip('/') + '/' + parts.path.lstrip('/') + (f"?{parts.query}" if parts.query else "")
+
+
+class ReplayAction(ActionStrategy):
+    """
+    Replays a recorded request log against a target, preserving the original inter-arrival times
+    (scaled by a speed multiplier) and bounding the number of requests in flight.
+    """
+    def execute(self, params: Dict[str, Any]) -> Any:
+        log_path = params['log_path']
+        base_url = params.get('base_url')
+        speed = params.get('speed', 1.0)  # 0 replays as fast as the concurrency allows
+        concurrency = params.get('concurrency', 16)
+        timeout = params.get('timeout', 10)
+        max_requests = params.get('max_requests')
+        max_gap = params.get('max_gap', 60.0)  # Idle periods of the replay (after scaling) are shortened to this
+        samples_path = params.get('samples_path')  # Optional per-request samples for the graph and report actions
+        print(f"Replaying {log_path} at {speed}x with concurrency {concurrency}")
+
+        sessions = threading.local()
+        slots = threading.BoundedSemaphore(concurrency)
+        lock = threading.Lock()
+        latencies = LatencyHistogram()  # Bounded memory no matter how long the log is
+        samples = SampleWriter(samples_path) if samples_path else None
+        stats = {'requests': 0, 'errors': 0, 'max_lag': 0.0, 'shortened_gaps': 0}
+
+        def send(record):
+            session = getattr(sessions, 'session', None)
+            if session is None:
+                session = sessions.session = requests.Session()
+            sent = time.time()
+            started = time.perf_counter()
+            try:
+                response = session.request(record['method'], replay_url(base_url, record['url']),
+                                           headers=record['headers'], data=record['body'], timeout=timeout)
+                ok = response.ok
+            except Exception:
+                # Not only connection errors: a recorded header or body requests rejects must count as a failed request
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.add(elapsed)
+                stats['requests'] += 1
+                if not ok:
+                    stats['errors'] += 1
+                if samples:
+                    samples.add(f"replay {record['method']}", sent, elapsed, ok)
+
+        started = time.perf_counter()
+        first_timestamp = None
+        last_due, shift = started, 0.0
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                records = iter_records(log_path, params.get('format'), params.get('timestamp_unit'))
+                for index, record in enumerate(records):
+                    if max_requests is not None and index >= max_requests:
+                        break
+                    if speed:
+                        if first_timestamp is None:
+                            first_timestamp = record['timestamp']
+                        due = started + (record['timestamp'] - first_timestamp) / speed - shift
+                        if due - last_due > max_gap:
+                            # Don't let the replay sit idle for hours on a gap in the recording
+                            shift += due - last_due - max_gap
+                            due = last_due + max_gap
+                            stats['shortened_gaps'] += 1
+                        last_due = max(last_due, due)
+                        delay = due - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                    # Blocks while all slots are busy, so only `concurrency` records are ever held in memory
+                    slots.acquire()
+                    if speed:
+                        stats['max_lag'] = max(stats['max_lag'], time.perf_counter() - due)
+                    future = pool.submit(send, record)
+                    future.add_done_callback(lambda _: slots.release())
+        finally:
+            if samples:
+                samples.close()
+        wall_time = time.perf_counter() - started
+
+        summary = {
+            'requests': stats['requests'],
+            'errors': stats['errors'],
+            'error_rate': stats['errors'] / stats['requests'] if stats['requests'] else 0.0,
+            'duration': wall_time,
+            'throughput': stats['requests'] / wall_time if wall_time else 0.0,
+            'p50_ms': (latencies.percentile(50) or 0.0) * 1000,
+            'p99_ms': (latencies.percentile(99) or 0.0) * 1000,
+            'max_lag_ms': stats['max_lag'] * 1000,
+            'shortened_gaps': stats['shortened_gaps'],
+        }
+        print(f"[bold green]Replay finished:[/bold green] {summary}")
+        if samples:
+            print(f"Replay samples written to {samples_path}")
+        max_error_rate = params.get('max_error_rate')
+        if not summary['requests'] or (max_error_rate is not None and summary['error_rate'] > max_error_rate):
+            return False
+        return summary
@@ -0,0 +1,304 @@
+import json
+import os
+from typing import Any, Dict, List
+from rich import print
+import numpy as np
+from lib.nitro.samples import SAMPLE_DTYPE
+from lib.nitro.strategy import ActionStrategy
+
+PERCENTILES = (50, 90, 99)
+
+
+def make_samples(stage_names: List[str], stage, start, duration, ok) -> Dict[str, Any]:
+    """
+    Builds a sample set: one entry per timed execution, with the stage stored as an index into stage_names.
+    :param stage_names: The distinct stage names.
+    :param stage: Stage index of every sample.
+    :param start: Start of every sample, epoch seconds.
+    :param duration: Duration of every sample in seconds.
+    :param ok: Whether every sample succeeded.
+    """
+    return {
+        'stage_names': list(stage_names),
+        'stage': np.asarray(stage, dtype=np.int64),
+        'start': np.asarray(start, dtype=np.float64),
+        'duration': np.asarray(duration, dtype=np.float64),
+        'ok': np.asarray(ok, dtype=bool),
+    }
+
+
+def samples_from_stage_records(stage_records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Converts the stage dictionaries collected by the TestOrchestrator into samples. Stages that never ran are ignored.
+    """
+    timed = [record for record in stage_records if record.get('start_time') is not None and record.get('duration') is not None]
+    stage_names = sorted({record['name'] for record in timed})
+    index = {name: position for position, name in enumerate(stage_names)}
+    return make_samples(
+        stage_names,
+        [index[record['name']] for record in timed],
+        [record['start_time'] for record in timed],
+        [record['duration'] for record in timed],
+        [record['state'] == 'completed' for record in timed],
+    )
+
+
+def save_samples(path: str, samples: Dict[str, Any]) -> None:
+    """
+    Saves samples as a compressed NumPy archive, which loads millions of samples in well under a second.
+    """
+    np.savez_compressed(path, stage_names=np.asarray(samples['stage_names'], dtype=str), stage=samples['stage'],
+                        start=samples['start'], duration=samples['duration'], ok=samples['ok'])
+
+
+def load_samples(path: str) -> Dict[str, Any]:
+    """
+    Loads samples written by SampleWriter, a NumPy archive (.npz) written by save_samples, or JSONL with one
+    {"stage", "start", "duration", "ok"} object per line, e.g. exported from the results database.
+    """
+    if os.path.exists(path + '.names.json'):
+        with open(path + '.names.json', 'r') as f:
+            stage_names = json.load(f)
+        records = np.fromfile(path, dtype=SAMPLE_DTYPE)
+        return make_samples(stage_names, records['stage'], records['start'], records['duration'], records['ok'])
+    if path.endswith('.npz'):
+        with np.load(path) as archive:
+            return make_samples(archive['stage_names'].tolist(), archive['stage'], archive['start'],
+                                archive['duration'], archive['ok'])
+    index: Dict[str, int] = {}
+    stage, start, duration, ok = [], [], [], []
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            stage.append(index.setdefault(entry['stage'], len(index)))
+            start.append(entry['start'])
+            duration.append(entry['duration'])
+            ok.append(entry.get('ok', True))
+    return make_samples(list(index), stage, start, duration, ok)
+
+
+def _group_stats(groups: np.ndarray, duration: np.ndarray, ok: np.ndarray, group_count: int) -> Dict[str, np.ndarray]:
+    # Lay out every group's durations as a contiguous sorted slice, then pick the nearest-rank
+    # percentiles of all groups with a single fancy-indexing operation.
+    counts = np.bincount(groups, minlength=group_count)
+    errors = np.bincount(groups, weights=~ok, minlength=group_count)
+    totals = np.bincount(groups, weights=duration, minlength=group_count)
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    if group_count == 1:
+        sorted_duration = np.sort(duration)
+    else:
+        # A stable group sort plus a per-group value sort is much faster than np.lexsort on large inputs
+        sorted_duration = duration[np.argsort(groups, kind='stable')]
+        for offset, count in zip(offsets, counts):
+            sorted_duration[offset:offset + count].sort()
+    present = counts > 0
+    stats = {
+        'count': counts,
+        'errors': errors.astype(np.int64),
+        'error_rate': np.divide(errors, counts, out=np.zeros(group_count), where=present),
+        'mean': np.divide(totals, counts, out=np.zeros(group_count), where=present),
+    }
+    for pct in PERCENTILES + (100,):
+        ranks = np.maximum(np.ceil(pct / 100.0 * counts).astype(np.int64) - 1, 0)
+        picked = sorted_duration[np.minimum(offsets + ranks, len(sorted_duration) - 1)] if len(sorted_duration) else np.zeros(group_count)
+        stats[f'p{pct}'] = np.where(present, picked, 0.0)
+    return stats
+
+
+def aggregate(samples: Dict[str, Any], window: float = 1.0, max_windows: int = 10000) -> Dict[str, Any]:
+    """
+    Aggregates samples into latency percentiles, error rates and throughput, overall and per stage,
+    plus the throughput over fixed time windows.
+    :param samples: Samples as returned by make_samples or load_samples.
+    :param window: Width of the throughput windows in seconds.
+    :param max_windows: Upper bound for the number of windows; the window is widened for long spans.
+    :return: A JSON serialisable summary.
+    """
+    stage, start, duration, ok = samples['stage'], samples['start'], samples['duration'], samples['ok']
+    stage_names = samples['stage_names']
+    if not len(start):
+        return {'samples': 0, 'window': window, 'overall': None, 'stages': {}, 'timeline': None}
+
+    first = float(start.min())
+    span = max(float((start + duration).max()) - first, window)
+    window = max(window, span / max_windows)
+    windows = np.floor((start - first) / window).astype(np.int64)
+    window_count = int(windows.max()) + 1
+
+    def to_summary(stats, position):
+        return {
+            'count': int(stats['count'][position]),
+            'errors': int(stats['errors'][position]),
+            'error_rate': float(stats['error_rate'][position]),
+            'throughput': float(stats['count'][position]) / span,
+            'mean_ms': float(stats['mean'][position]) * 1000,
+            **{f'p{pct}_ms': float(stats[f'p{pct}'][position]) * 1000 for pct in PERCENTILES},
+            'max_ms': float(stats['p100'][position]) * 1000,
+        }
+
+    overall = _group_stats(np.zeros(len(start), dtype=np.int64), duration, ok, 1)
+    per_stage = _group_stats(stage, duration, ok, len(stage_names))
+    per_window = np.bincount(stage * window_count + windows, minlength=len(stage_names) * window_count)
+    per_window = per_window.reshape(len(stage_names), window_count)
+    error_window = np.bincount(windows, weights=~ok, minlength=window_count)
+
+    return {
+        'samples': int(len(start)),
+        'window': window,
+        'start': first,
+        'duration': span,
+        'overall': to_summary(overall, 0),
+        'stages': {name: to_summary(per_stage, position) for position, name in enumerate(stage_names)},
+        'timeline': {
+            'offset': (np.arange(window_count) * window).tolist(),
+            'throughput': (per_window.sum(axis=0) / window).tolist(),
+            'errors': error_window.astype(np.int64).tolist(),
+            'stages': {name: (per_window[position] / window).tolist() for position, name in enumerate(stage_names)},
+        },
+    }
+
+
+def collect_samples(params: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Gathers the samples for the graph and report actions as separate series: the stage records injected
+    by the TestOrchestrator ('stage_timings') and the optional per-request samples file given as
+    'samples_path' ('request_samples'). They are never mixed, as whole-stage durations and request latencies
+    are recorded on different clocks and scales.
+    :return: The non-empty series by name.
+    """
+    sources = {'stage_timings': samples_from_stage_records(params.get('stage_records', []))}
+    samples_path = params.get('samples_path')
+    if samples_path:
+        if os.path.exists(samples_path):
+            sources['request_samples'] = load_samples(samples_path)
+        else:
+            print(f"[bold red]Samples file '{samples_path}' not found.[/bold red]")
+    return {name: samples for name, samples in sources.items() if len(samples['start'])}
+
+
+def aggregate_sources(sources: Dict[str, Dict[str, Any]], window: float = 1.0) -> Dict[str, Dict[str, Any]]:
+    """
+    Aggregates every series on its own, so each gets its own span and time windows.
+    """
+    return {name: aggregate(samples, window) for name, samples in sources.items()}
+
+
+def render_charts(summaries: Dict[str, Dict[str, Any]], output_dir: str, graph_type: str = "bar") -> List[str]:
+    """
+    Renders charts of aggregated series as PNG files.
+    :param summaries: Aggregated series by name, as returned by aggregate_sources.
+    :param graph_type: "bar" for latency percentiles per stage (one panel per series), "line" for throughput
+                       over time of the request samples (or the stage timings without them), "all" for both.
+    :return: The paths of the written charts.
+    """
+    if graph_type not in ("bar", "line", "all"):
+        raise ValueError(f"Unknown graph type: {graph_type}")
+    # Imported here so that loading the actions (and every stage with them) does not load matplotlib
+    from matplotlib.figure import Figure
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    if graph_type in ("bar", "all"):
+        figure = Figure(figsize=(10, 5 * len(summaries)))
+        for axes, (source, summary) in zip(np.atleast_1d(figure.subplots(len(summaries), 1)), summaries.items()):
+            stage_names = list(summary['stages'])
+            positions = np.arange(len(stage_names))
+            width = 0.8 / len(PERCENTILES)
+            for offset, pct in enumerate(PERCENTILES):
+                values = [summary['stages'][name][f'p{pct}_ms'] for name in stage_names]
+                axes.bar(positions + offset * width, values, width, label=f"p{pct}")
+            axes.set_xticks(positions + width * (len(PERCENTILES) - 1) / 2)
+            axes.set_xticklabels(stage_names, rotation=30, ha='right')
+            axes.set_ylabel("Latency (ms)")
+            axes.set_title(f"Latency percentiles per stage ({source})")
+            axes.legend()
+        figure.tight_layout()
+        paths.append(os.path.join(output_dir, "latency_percentiles.png"))
+        figure.savefig(paths[-1])
+    if graph_type in ("line", "all"):
+        source = 'request_samples' if 'request_samples' in summaries else 'stage_timings'
+        summary = summaries[source]
+        figure = Figure(figsize=(10, 5))
+        axes = figure.subplots()
+        timeline = summary['timeline']
+        axes.plot(timeline['offset'], timeline['throughput'], label="total", linewidth=2)
+        for name in summary['stages']:
+            axes.plot(timeline['offset'], timeline['stages'][name], label=name, linewidth=1)
+        axes.set_xlabel(f"Time (s, {summary['window']:g}s windows)")
+        axes.set_ylabel("Throughput (samples/s)")
+        axes.set_title(f"Throughput over time ({source})")
+        axes.legend()
+        figure.tight_layout()
+        paths.append(os.path.join(output_dir, "throughput.png"))
+        figure.savefig(paths[-1])
+    return paths
+
+
+def write_report(summaries: Dict[str, Dict[str, Any]], output_dir: str, report_type: str = "macro") -> str:
+    """
+    Writes aggregated series as JSON and as a Markdown report, with one section per series.
+    :param summaries: Aggregated series by name, as returned by aggregate_sources.
+    :param report_type: "macro" for overall and per-stage figures, "micro" to also include the windowed timeline.
+    :return: The path of the Markdown report.
+    """
+    if report_type not in ("macro", "micro"):
+        raise ValueError(f"Unknown report type: {report_type}")
+    os.makedirs(output_dir, exist_ok=True)
+    content = {source: dict(summary) if report_type == "micro" else {k: v for k, v in summary.items() if k != 'timeline'}
+               for source, summary in summaries.items()}
+    with open(os.path.join(output_dir, f"report_{report_type}.json"), 'w') as f:
+        json.dump(content, f, indent=2)
+
+    columns = ("count", "errors", "error_rate", "throughput", "mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms")
+    lines = [f"# Nitro {report_type} report"]
+    for source, summary in summaries.items():
+        lines += ["", f"## {source}", "", f"Samples: {summary['samples']}, duration: {summary['duration']:.2f}s", "",
+                  "| stage | " + " | ".join(columns) + " |", "|" + "---|" * (len(columns) + 1)]
+        rows = [('overall', summary['overall'])] + list(summary['stages'].items())
+        for name, stats in rows:
+            lines.append(f"| {name} | " + " | ".join(f"{stats[column]:.3f}" if isinstance(stats[column], float) else str(stats[column])
+                                                       for column in columns) + " |")
+        if report_type == "micro":
+            timeline = summary['timeline']
+            lines += ["", f"### Throughput per {summary['window']:g}s window", "", "| offset (s) | throughput | errors |", "|---|---|---|"]
+            lines += [f"| {offset:.1f} | {throughput:.1f} | {errors} |"
+                      for offset, throughput, errors in zip(timeline['offset'], timeline['throughput'], timeline['errors'])]
+    path = os.path.join(output_dir, f"report_{report_type}.md")
+    with open(path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+class GraphAction(ActionStrategy):
+    """
+    Renders charts from the collected stage timings and any recorded request samples.
+    """
+    requires_history = True
+
+    def execute(self, params: Dict[str, Any]) -> Any:
+        sources = collect_samples(params)
+        if not sources:
+            print("[bold red]No samples to graph.[/bold red]")
+            return False
+        summaries = aggregate_sources(sources, params.get('window', 1.0))
+        paths = render_charts(summaries, params.get('output_dir', 'nitro_reports'), params.get('graph_type', 'bar'))
+        print(f"[bold green]Charts written:[/bold green] {paths}")
+        return paths
+
+
+class ReportAction(ActionStrategy):
+    """
+    Aggregates the collected stage timings and any recorded request samples into a report file.
+    """
+    requires_history = True
+
+    def execute(self, params: Dict[str, Any]) -> Any:
+        sources = collect_samples(params)
+        if not sources:
+            print("[bold red]No samples to report.[/bold red]")
+            return False
+        summaries = aggregate_sources(sources, params.get('window', 1.0))
+        path = write_report(summaries, params.get('output_dir', 'nitro_reports'), params.get('report_type', 'macro'))
+        print(f"[bold green]Report written:[/bold green] {path}")
+        return path
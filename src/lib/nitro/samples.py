@@ -0,0 +1,36 @@
+import json
+from typing import Dict
+import numpy as np
+
+# Record layout of sample files streamed by SampleWriter
+SAMPLE_DTYPE = np.dtype([('stage', '<i4'), ('start', '<f8'), ('duration', '<f8'), ('ok', '?')])
+
+
+class SampleWriter:
+    """
+    Streams samples to disk in fixed-size chunks, so recording a long run keeps memory flat.
+    Writes raw SAMPLE_DTYPE records to the given path and the stage names to '<path>.names.json' on close.
+    Not thread-safe; callers serialise add().
+    """
+    def __init__(self, path: str, chunk_size: int = 65536):
+        self.path = path
+        self._file = open(path, 'wb')
+        self._chunk = np.empty(chunk_size, dtype=SAMPLE_DTYPE)
+        self._used = 0
+        self._stage_names: Dict[str, int] = {}
+
+    def add(self, stage_name: str, start: float, duration: float, ok: bool) -> None:
+        self._chunk[self._used] = (self._stage_names.setdefault(stage_name, len(self._stage_names)), start, duration, ok)
+        self._used += 1
+        if self._used == len(self._chunk):
+            self.flush()
+
+    def flush(self) -> None:
+        self._chunk[:self._used].tofile(self._file)
+        self._used = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+        with open(self.path + '.names.json', 'w') as f:
+            json.dump(list(self._stage_names), f)
@@ -0,0 +1,239 @@
+import heapq
+import json
+import os
+import threading
+from datetime import datetime
+from statistics import median
+from typing import Any, Dict, List, Optional
+from rich import print
+
+
+def suite_name(suite_class) -> str:
+    """
+    Returns the name a testsuite is reported under, which is the custom testsuite name if one was given.
+    """
+    name = getattr(suite_class, 'name', None)
+    return name if isinstance(name, str) and name else suite_class.__name__
+
+
+def testcase_names(suite_class) -> List[str]:
+    """
+    Returns the reported names of the testcases defined on a testsuite class, in definition order.
+    A parametrized testcase is returned once, under its template name.
+    """
+    names = []
+    for attribute in vars(suite_class).values():
+        if not callable(attribute) or getattr(attribute, '_parametrization_template', None):
+            continue  # Generated testcases are estimated through their template
+        if getattr(attribute, '__testcase__', False) or getattr(attribute, '__parametrization_template__', False):
+            name = getattr(attribute, 'name', None)
+            names.append(name if isinstance(name, str) and name else attribute.__name__)
+    return names
+
+
+def is_exclusive(suite_class) -> bool:
+    """
+    Returns whether a testsuite must run without any other shard alongside it, e.g. because it generates load
+    or asserts on wall-clock timings. Such suites set the class attribute `exclusive = True`.
+    """
+    return bool(getattr(suite_class, 'exclusive', False))
+
+
+class DurationStore:
+    """
+    Persists per-testcase durations across runs so suites can be scheduled by their expected cost.
+    Durations are smoothed with an exponentially weighted moving average to damp noisy runs.
+    """
+    def __init__(self, path: str = "nitro_durations.json", smoothing: float = 0.5, default_seconds: float = 30.0):
+        """
+        :param path: JSON file holding the recorded durations.
+        :param smoothing: Weight of the newest observation in the moving average (0.0 - 1.0).
+        :param default_seconds: Estimate used for a testcase, or a suite whose testcases are unknown,
+                                when no history exists at all.
+        """
+        self.path = path
+        self.smoothing = smoothing
+        self.default_seconds = default_seconds
+        self._durations: Dict[str, Dict[str, float]] = {}
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self._durations = json.load(f).get('suites', {})
+        except (OSError, ValueError) as e:
+            print(f"[bold red]Could not load durations from {self.path}: {e}[/bold red]")
+            self._durations = {}
+
+    def save(self) -> None:
+        with open(self.path, 'w') as f:
+            json.dump({'suites': self._durations}, f, indent=2, sort_keys=True)
+
+    def record(self, suite: str, testcase: str, seconds: float) -> None:
+        """
+        Records an observed testcase duration.
+        :param suite: The reported testsuite name.
+        :param testcase: The reported testcase name.
+        :param seconds: The observed duration in seconds.
+        """
+        testcases = self._durations.setdefault(suite, {})
+        previous = testcases.get(testcase)
+        if previous is None:
+            testcases[testcase] = seconds
+        else:
+            testcases[testcase] = self.smoothing * seconds + (1 - self.smoothing) * previous
+
+    def estimate(self, suite: str, testcases: Optional[List[str]] = None) -> float:
+        """
+        Estimates the duration of a suite as the sum of its testcases. Testcases without history, e.g. ones
+        newly added to a known suite, are estimated as the median of all recorded testcases, or
+        default_seconds if nothing was recorded yet.
+        A parametrized testcase is estimated as the sum of the cases reported as '<template name> <suffix>',
+        which covers testplan's default and index-suffixed names; cases named by a custom name_func
+        that drops the template name are not matched and get the fallback estimate.
+        :param suite: The reported testsuite name.
+        :param testcases: The reported testcase names of the suite. If not given, the recorded testcases
+                          are used and suites without history fall back to the median of the known suites.
+        """
+        recorded = self._durations.get(suite, {})
+        if testcases:
+            known = [seconds for tcs in self._durations.values() for seconds in tcs.values()]
+            fallback = median(known) if known else self.default_seconds
+            total = 0.0
+            for testcase in testcases:
+                seconds = _recorded_seconds(recorded, testcase)
+                total += fallback if seconds is None else seconds
+            return total
+        if recorded:
+            return sum(recorded.values())
+        known = [sum(tcs.values()) for tcs in self._durations.values() if tcs]
+        return median(known) if known else self.default_seconds
+
+    def update_from_report(self, report_path: str) -> int:
+        """
+        Records the testcase durations of a testplan JSON report and saves the store.
+        :param report_path: Path of the JSON report written via the test plan's json_path.
+        :return: The number of testcases recorded.
+        """
+        if not os.path.exists(report_path):
+            print(f"[bold red]Report '{report_path}' not found, durations not updated.[/bold red]")
+            return 0
+        with open(report_path, 'r') as f:
+            report = json.load(f)
+        recorded = self._record_entries(report.get('entries', []), suite=None)
+        self.save()
+        print(f"[bold green]Recorded durations of {recorded} testcases to {self.path}[/bold green]")
+        return recorded
+
+    def _record_entries(self, entries: List[Dict[str, Any]], suite: str) -> int:
+        recorded = 0
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            if entry.get('category') == 'testsuite':
+                recorded += self._record_entries(entry.get('entries', []), entry.get('name'))
+            elif entry.get('category') == 'synthesized':
+                continue  # Suite setup/teardown and environment hooks, e.g. a shard waiting for its turn
+            elif entry.get('type') == 'TestCaseReport' or entry.get('category') == 'testcase':
+                seconds = _run_seconds(entry.get('timer') or {})
+                if suite and seconds is not None:
+                    self.record(suite, entry.get('name'), seconds)
+                    recorded += 1
+            else:
+                recorded += self._record_entries(entry.get('entries', []), suite)
+        return recorded
+
+
+def _recorded_seconds(recorded: Dict[str, float], testcase: str) -> Optional[float]:
+    if testcase in recorded:
+        return recorded[testcase]
+    generated = [seconds for name, seconds in recorded.items() if name.startswith(testcase + ' ')]
+    return sum(generated) if generated else None
+
+
+def _run_seconds(timer: Dict[str, Any]):
+    # Depending on the testplan version the run timer is a single interval or a list of intervals,
+    # stamped with ISO 8601 strings or epoch seconds
+    intervals = timer.get('run')
+    if isinstance(intervals, dict):
+        intervals = [intervals]
+    if not intervals:
+        return None
+    total = 0.0
+    for interval in intervals:
+        start, end = _timestamp(interval.get('start')), _timestamp(interval.get('end'))
+        if start is None or end is None:
+            return None
+        total += end - start
+    return total
+
+
+def _timestamp(value) -> Optional[float]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str) and value:
+        return datetime.fromisoformat(value).timestamp()
+    return None
+
+
+def shard_suites(suite_classes: list, shard_count: int, store: DurationStore) -> List[list]:
+    """
+    Splits suites into balanced shards using longest-processing-time-first scheduling:
+    suites are placed from the most to the least expensive, each on the currently least loaded shard.
+    Exclusive suites (see is_exclusive) are not balanced; each gets a shard of its own, listed first.
+    :param suite_classes: The testsuite classes to distribute.
+    :param shard_count: The number of shards for the shared suites, usually the number of pool workers.
+    :param store: Historical durations used to estimate each suite.
+    :return: A list of shards, each a list of suite classes. Empty shards are dropped.
+    """
+    exclusive = [cls for cls in suite_classes if is_exclusive(cls)]
+    shared = [cls for cls in suite_classes if not is_exclusive(cls)]
+    shard_count = max(1, min(shard_count, len(shared)))
+    estimates = sorted(((store.estimate(suite_name(cls), testcase_names(cls)), index, cls)
+                        for index, cls in enumerate(shared)),
+                       key=lambda item: (-item[0], item[1]))
+    loads = [(0.0, shard) for shard in range(shard_count)]
+    shards: List[list] = [[] for _ in range(shard_count)]
+    for estimate, _, cls in estimates:
+        load, shard = heapq.heappop(loads)
+        shards[shard].append(cls)
+        heapq.heappush(loads, (load + estimate, shard))
+    for cls in exclusive:
+        print(f"Exclusive shard: estimated {store.estimate(suite_name(cls), testcase_names(cls)):.1f}s - {[suite_name(cls)]}")
+    for load, shard in sorted(loads, key=lambda item: item[1]):
+        print(f"Shard {shard + 1}: estimated {load:.1f}s - {[suite_name(cls) for cls in shards[shard]]}")
+    return [[cls] for cls in exclusive] + [shard for shard in shards if shard]
+
+
+class ShardGate:
+    """
+    Keeps exclusive shards apart from all other shards running in the same process. Shared shards run
+    together; an exclusive shard waits until the running shards finish and holds back new ones until it is done.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._exclusive_waiting = 0
+
+    def acquire(self, exclusive: bool = False) -> None:
+        with self._condition:
+            if exclusive:
+                self._exclusive_waiting += 1
+                self._condition.wait_for(lambda: not self._exclusive and not self._shared)
+                self._exclusive_waiting -= 1
+                self._exclusive = True
+            else:
+                # Waiting exclusive shards go first, so a steady stream of shared shards cannot starve them
+                self._condition.wait_for(lambda: not self._exclusive and not self._exclusive_waiting)
+                self._shared += 1
+
+    def release(self, exclusive: bool = False) -> None:
+        with self._condition:
+            if exclusive:
+                self._exclusive = False
+            else:
+                self._shared -= 1
+            self._condition.notify_all()
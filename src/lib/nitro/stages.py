@@ -78,7 +78,11 @@ def http_get_stage(testcase_params):
     return Stage(
         name='http_get',
         action='http',
-        params={'url': testcase_params.get('http_url', 'https://httpbin.org/get')}
+        params={
+            'url': testcase_params.get('http_url', 'https://httpbin.org/get'),
+            'send_request': testcase_params.get('http_send_request', False),
+            'timeout': testcase_params.get('http_timeout', 10)
+        }
     )
 
 def sleep_2s_stage(testcase_params):
@@ -102,6 +106,22 @@ def recover_db_stage(testcase_params):
         params={'recovery_type': 'Restart Database'}
     )
 
+def replay_traffic_stage(testcase_params):
+    return Stage(
+        name='replay_traffic',
+        action='replay',
+        params={
+            'log_path': testcase_params.get('replay_log', 'traffic.jsonl'),
+            'base_url': testcase_params.get('replay_base_url'),
+            'speed': testcase_params.get('replay_speed', 1.0),
+            'concurrency': testcase_params.get('replay_concurrency', 16),
+            'max_error_rate': testcase_params.get('replay_max_error_rate'),
+            'timestamp_unit': testcase_params.get('replay_timestamp_unit'),
+            'max_gap': testcase_params.get('replay_max_gap', 60.0),
+            'samples_path': testcase_params.get('samples_path')
+        }
+    )
+
 def metrics_stage(testcase_params):
     return Stage(
         name='metrics_stage',
@@ -112,17 +132,24 @@ def metrics_stage(testcase_params):
 
 def graph_stage(testcase_params):
     return Stage(
-        name='graphs_stage',
+        name='graph_stage',
         action='graph',
-        params={'graph_type': 'bar'},
-        depends_on='metrics_stage'
+        params={
+            'graph_type': testcase_params.get('graph_type', 'bar'),
+            'output_dir': testcase_params.get('report_dir', 'nitro_reports'),
+            'samples_path': testcase_params.get('samples_path')
+        }
     )
 
 def report_stage(testcase_params):
     return Stage(
         name='report_stage',
         action='generate_report',
-        params={'report_type': 'macro'},
+        params={
+            'report_type': testcase_params.get('report_type', 'macro'),
+            'output_dir': testcase_params.get('report_dir', 'nitro_reports'),
+            'samples_path': testcase_params.get('samples_path')
+        },
         depends_on='graph_stage'
     )
 
@@ -208,7 +235,9 @@ StageFactory.register_factory('http_get', http_get_stage)
 StageFactory.register_factory('sleep_2s', sleep_2s_stage)
 StageFactory.register_factory('read_file', read_file_stage)
 StageFactory.register_factory('recover_db', recover_db_stage)
+StageFactory.register_factory('replay_traffic', replay_traffic_stage)
 StageFactory.register_factory('metrics_stage', metrics_stage)
+StageFactory.register_factory('graph_stage', graph_stage)
 StageFactory.register_factory('report_stage', report_stage)
 
 
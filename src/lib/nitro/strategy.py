@@ -1,30 +1,47 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any
 from rich import print
+import threading
 import time
 import requests
 
 class ActionStrategy(ABC):
+    # Actions that set this receive the stages executed so far as params['stage_records']
+    requires_history = False
+
     @abstractmethod
     def execute(self, params: Dict[str, Any]) -> Any:
         pass
 
 class HttpAction(ActionStrategy):
+    def __init__(self):
+        # One session per thread keeps connections alive, so load steps do not measure TCP setup
+        self._sessions = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._sessions, 'session', None)
+        if session is None:
+            session = self._sessions.session = requests.Session()
+        return session
+
     def execute(self, params: Dict[str, Any]) -> Any:
         url = params.get('url')
-        print(f"Executing HTTP action for URL: {url}")
+        if not params.get('quiet'):
+            print(f"Executing HTTP action for URL: {url}")
         # Simulate a failure for demonstration purposes
         if url == "https://simulate-failure.com":
             print("[bold red]Simulating failure for HTTP action[/bold red]")
             return False  # Simulate a failed stage
-        return True  # Simulate a successful stage
-        # Uncomment the following lines to make an actual HTTP request
-        # try:
-        #     response = requests.get(url)
-        #     response.raise_for_status()
-        #     return response.json()
-        # except requests.exceptions.RequestException as e:
-        #     return str(e)
+        if not params.get('send_request'):
+            return True  # Simulate a successful stage
+        # Make an actual HTTP request, e.g. when driving load against a real or stub server
+        try:
+            response = self._session().get(url, timeout=params.get('timeout', 10))
+            return response.ok
+        except requests.exceptions.RequestException as e:
+            if not params.get('quiet'):
+                print(f"[bold red]HTTP request failed: {e}[/bold red]")
+            return False
 
 class APIAction(ActionStrategy):
     def execute(self, params: Dict[str, Any]) -> Any:
@@ -0,0 +1,92 @@
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from rich import print
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # The default backlog of 5 stalls the first connections of a large step
+
+
+class StubServer:
+    """
+    Local HTTP stub server with configurable latency, used to exercise load and capacity tests
+    without depending on external services.
+    """
+    def __init__(self, latency: float = 0.01, error_rate: float = 0.0, workers: int = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        :param latency: Service time of each request in seconds.
+        :param error_rate: Fraction of requests answered with HTTP 500 (0.0 - 1.0).
+        :param workers: Maximum number of requests served concurrently. Requests beyond this
+                        limit queue up, so latency grows with load like a real service. None means unbounded.
+        :param host: Interface to bind to.
+        :param port: Port to bind to, 0 picks a free port.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers) if workers else None
+        self._server = _StubHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def _make_handler(self):
+        stub = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, so clients reusing a session skip TCP setup
+            disable_nagle_algorithm = True  # Headers and body are separate writes; don't wait for delayed ACKs
+
+            def _respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                if stub._slots:
+                    stub._slots.acquire()
+                try:
+                    time.sleep(stub.latency)
+                finally:
+                    if stub._slots:
+                        stub._slots.release()
+                status = 500 if random.random() < stub.error_rate else 200
+                body = b'{"status": "ok"}' if status == 200 else b'{"status": "error"}'
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _respond
+            do_POST = _respond
+            do_PUT = _respond
+            do_DELETE = _respond
+
+            def log_message(self, format, *args):
+                pass  # Keep load test output readable
+
+        return _Handler
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        print(f"[bold green]Stub server listening on {self.url}[/bold green]")
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+        print("[bold yellow]Stub server stopped.[/bold yellow]")
+
+    def __enter__(self) -> 'StubServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
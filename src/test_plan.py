@@ -1,3 +1,4 @@
+import os
 import sys
 from rich import print
 from rich.console import Console
@@ -10,45 +11,53 @@ from rich.table import Table
 # import testplan
 from testplan.report.testing.styles import Style, StyleEnum
 from testplan import test_plan
-from testplan.testing.multitest import MultiTest
-# from testplan.runners.pools import ThreadPool
-from test_suites import (
-  PerformanceTestSuite, RecoveryTestSuite, 
-  StageExecutionSuite, UnregisteredStageExecutionSuite,
-  UnregisteredGraphStageExecutionSuite,
-  UnregisteredReportStageExecutionSuite
-)
+from testplan.runners.pools import ThreadPool
+from testplan.runners.pools.tasks import Task
+from test_suites import SUITES
 
 from lib.nitro.orchestrator import TestOrchestrator
+from lib.nitro.sharding import DurationStore, is_exclusive, shard_suites
 
 
 OUTPUT_STYLE = Style(StyleEnum.ASSERTION_DETAIL, StyleEnum.ASSERTION_DETAIL)
+PLAN_DIR = os.path.dirname(os.path.abspath(__file__))
+POOL_NAME = 'NitroPool'
+POOL_SIZE = 4
+REPORT_JSON_PATH = os.path.join(PLAN_DIR, "report.json")
+DURATIONS_PATH = os.path.join(PLAN_DIR, "nitro_durations.json")
 
 
 @test_plan(
     name='My Test Plan',
     pdf_path="report.pdf",
+    json_path=REPORT_JSON_PATH,
     stdout_style=OUTPUT_STYLE,
     pdf_style=OUTPUT_STYLE,
-) # , runners=ThreadPool(workers=4))
+)
 def my_plan(plan):
     
     try:
-        print("========== Creating MultiTest plan...")
-        multi_test = MultiTest(
-          name='Environment Setup',
-          suites=[
-              PerformanceTestSuite(), 
-              RecoveryTestSuite(), 
-              StageExecutionSuite(),
-              UnregisteredStageExecutionSuite(),
-              UnregisteredGraphStageExecutionSuite(),
-              UnregisteredReportStageExecutionSuite(),
-          ],
-        )
-        # Add the test suite to the plan
-        print("========== Adding test suites...")
-        plan.add(multi_test)
+        print("========== Creating thread pool...")
+        plan.add_resource(ThreadPool(name=POOL_NAME, size=POOL_SIZE))
+
+        # Balance the suites across the pool workers using the durations of previous runs.
+        # Exclusive suites (load generators, timing assertions) get shards that run on their own.
+        print("========== Sharding test suites...")
+        shards = shard_suites(list(SUITES.values()), POOL_SIZE, DurationStore(DURATIONS_PATH))
+
+        print("========== Scheduling MultiTest shards...")
+        for index, shard in enumerate(shards):
+            task = Task(
+              target='make_shard_multitest',
+              module='test_suites',
+              path=PLAN_DIR,
+              kwargs={
+                  'name': f'Environment Setup {index + 1}',
+                  'suite_names': [suite.__name__ for suite in shard],
+                  'exclusive': is_exclusive(shard[0]),
+              },
+            )
+            plan.schedule(task, resource=POOL_NAME)
 
         """ Example usage of the TestOrchestrator
 
@@ -81,4 +90,7 @@ def my_plan(plan):
 # Example usage:
 if __name__ == "__main__":
 
-    sys.exit(not my_plan())
\ No newline at end of file
+    plan_result = my_plan()
+    # Record this run's testcase durations for the next run's sharding
+    DurationStore(DURATIONS_PATH).update_from_report(REPORT_JSON_PATH)
+    sys.exit(not plan_result)
\ No newline at end of file
@@ -2,10 +2,21 @@ import testplan
 from rich import print
 from testplan.runners.pools.tasks import Task
 # task, runtime_values
-from testplan.testing.multitest import testsuite, testcase
+from testplan.testing.multitest import MultiTest, testsuite, testcase
 from lib.nitro.orchestrator import TestOrchestrator
+from lib.nitro.capacity import CapacitySearch, SLO
+from lib.nitro.stub_server import StubServer
+from lib.nitro.replay import iter_records, replay_url
+from lib.nitro.reporting import make_samples, save_samples
+from lib.nitro.sharding import DurationStore, ShardGate, shard_suites, testcase_names
 import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 import pymongo
+import numpy as np
 
 # @task
 def run_test(testcase_name: str, stage_names: list, testcase_params: dict):
@@ -143,41 +154,462 @@ class UnregisteredStageExecutionSuite:
             result.fail(f"Test failed: {e}")
 
 
-@testsuite(name="Test Graph Stage - Unregistered Stage")
-class UnregisteredGraphStageExecutionSuite:
+@testsuite(name="Test Graph Stage")
+class GraphStageExecutionSuite:
     def __init__(self):
         self.stage_names = ['http_get', 'graph_stage', 'read_file']
-        self.testcase_params = {"http_url": "https://httpbin.org/get", "file_path": "my_file.txt"}
+        self.testcase_params = {"http_url": "https://httpbin.org/get", "file_path": "my_file.txt", "graph_type": "all"}
 
-    @testcase(name="unregistered_graph_stage_test_case")
-    def execute_unregistered_stages(self, env, result):
+    def setup(self, env):
+        self.testcase_params["report_dir"] = tempfile.mkdtemp()
+
+    def teardown(self, env):
+        shutil.rmtree(self.testcase_params["report_dir"])
+
+    @testcase(name="graph_stage_test_case")
+    def execute_graph_stages(self, env, result):
         """
-        Executes the stages using the TestOrchestrator.
+        Executes the stages using the TestOrchestrator and graphs the timings of the stages before the graph stage.
         """
-        print("*********** Running unregistered stage execution test case...")
+        print("*********** Running graph stage execution test case...")
         test_orchestrator = TestOrchestrator(self.stage_names, self.testcase_params)
         try:
             results = test_orchestrator.execute_test()
             result.true(all(r != "Failed: Action execution failed." for r in results), "All stages passed")
+            for chart in ('latency_percentiles.png', 'throughput.png'):
+                result.true(os.path.exists(os.path.join(self.testcase_params["report_dir"], chart)), f"{chart} was rendered")
         except RuntimeError as e:
             result.fail(f"Test failed: {e}")
 
 
-@testsuite(name="Test Report Stage - Unregistered Dependency Stage")
-class UnregisteredReportStageExecutionSuite:
+@testsuite(name="Test Report Stage")
+class ReportStageExecutionSuite:
     def __init__(self):
         self.stage_names = ['http_get', 'graph_stage', 'report_stage']
         self.testcase_params = {"http_url": "https://httpbin.org/get", "file_path": "my_file.txt"}
 
-    @testcase(name="unregistered_dependency_stage_test_case")
-    def execute_unregistered_dependency_stages(self, env, result):
+    def setup(self, env):
+        self.testcase_params["report_dir"] = tempfile.mkdtemp()
+
+    def teardown(self, env):
+        shutil.rmtree(self.testcase_params["report_dir"])
+
+    @testcase(name="report_stage_test_case")
+    def execute_report_stages(self, env, result):
         """
-        Executes the stages using the TestOrchestrator.
+        Executes the stages using the TestOrchestrator; the report stage runs once its graph_stage dependency has.
         """
-        print("*********** Running unregistered stage execution test case...")
+        print("*********** Running report stage execution test case...")
         test_orchestrator = TestOrchestrator(self.stage_names, self.testcase_params)
         try:
             results = test_orchestrator.execute_test()
             result.true(all(r != "Failed: Action execution failed." for r in results), "All stages passed")
+            with open(os.path.join(self.testcase_params["report_dir"], 'report_macro.json'), 'r') as f:
+                report = json.load(f)
+            result.equal(sorted(report['stage_timings']['stages']), ['graph_stage', 'http_get'], "Stages that ran before the report are reported")
+        except RuntimeError as e:
+            result.fail(f"Test failed: {e}")
+
+
+@testsuite(name="Capacity Search")
+class CapacitySearchSuite:
+    exclusive = True  # Drives load and measures latency; other shards would skew the curve
+
+    def __init__(self):
+        # The stub serves 4 requests at a time with 20ms latency, so it saturates around 200 req/s
+        self.stub_server = StubServer(latency=0.02, workers=4)
+        self.slo = SLO(p99_latency_ms=100, max_error_rate=0.01)
+
+    def setup(self, env):
+        self.stub_server.start()
+
+    def teardown(self, env):
+        self.stub_server.stop()
+
+    @testcase(name="http_get_capacity_test_case")
+    def find_http_get_capacity(self, env, result):
+        """
+        Searches for the maximum concurrency the http_get stage sustains within the SLO.
+        """
+        print("*********** Running capacity search test case...")
+        testcase_params = {"http_url": self.stub_server.url, "http_send_request": True}
+        search = CapacitySearch('http_get', self.slo, testcase_params, max_concurrency=64, step_duration=3, warmup=1)
+        summary = search.run()
+        for step in summary['curve']:
+            result.log(f"concurrency={step['concurrency']} throughput={step['throughput']:.1f} req/s "
+                       f"p99={step['p99_ms']:.1f} ms error_rate={step['error_rate']:.2%}")
+        result.true(summary['max_sustainable'] is not None, "A load level within the SLO was found")
+        # 4 workers at 20ms each peak at 200 req/s, so throughput stops rising somewhere around 4 to 8 clients
+        result.true(summary['knee'] is not None and summary['knee']['concurrency'] <= 16, "The stub server saturates early")
+        result.true(summary['max_sustainable'] is None or summary['knee']['concurrency'] <= summary['max_sustainable']['concurrency'],
+                    "The knee is not above the maximum sustainable load")
+
+
+
+@testsuite(name="Replay Traffic")
+class ReplayTrafficSuite:
+    exclusive = True  # Asserts on the wall time of the replay
+
+    def __init__(self):
+        self.stub_server = StubServer(latency=0.01)
+        self.request_count = 100
+        self.log_path = None
+
+    def setup(self, env):
+        self.stub_server.start()
+        # Record 100 requests spread over 2 seconds
+        fd, self.log_path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(fd, 'w') as f:
+            for index in range(self.request_count):
+                f.write(json.dumps({"timestamp": 1700000000 + index * 0.02, "method": "GET", "path": f"/items/{index}"}) + "\n")
+
+    def teardown(self, env):
+        self.stub_server.stop()
+        os.remove(self.log_path)
+
+    @testcase(name="replay_traffic_test_case")
+    def replay_recorded_traffic(self, env, result):
+        """
+        Replays the recorded log at double speed through the TestOrchestrator.
+        """
+        print("*********** Running replay traffic test case...")
+        testcase_params = {
+            "replay_log": self.log_path,
+            "replay_base_url": self.stub_server.url,
+            "replay_speed": 2.0,
+            "replay_concurrency": 8,
+            "replay_max_error_rate": 0.0,
+        }
+        test_orchestrator = TestOrchestrator(['replay_traffic'], testcase_params)
+        try:
+            summary = test_orchestrator.execute_test()[0]
+            result.log(str(summary))
+            result.equal(summary['requests'], self.request_count, "All recorded requests were replayed")
+            # The log spans 1.98s, so a 2x replay takes about 0.99s; 1x would take about 2s
+            result.true(0.9 <= summary['duration'] <= 1.5, f"Replay at 2x speed took {summary['duration']:.2f}s, about half the recorded time")
+        except RuntimeError as e:
+            result.fail(f"Test failed: {e}")
+
+    @testcase(name="replay_log_parsing_test_case")
+    def parse_recorded_log(self, env, result):
+        """
+        Checks timestamp units, implausible timestamps, malformed headers and URLs behind a path prefix.
+        """
+        lines = [
+            {"timestamp": 1700000000500, "path": "/ms"},
+            {"timestamp": 1e20, "path": "/far-future"},
+            {"timestamp": -1, "path": "/negative"},
+            {"timestamp": 1700000001, "path": "/bad-headers", "headers": ["X-Test: 1"]},
+            {"timestamp": 1700000001, "path": "/seconds"},
+        ]
+        fd, log_path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(fd, 'w') as f:
+            f.write("\n".join(json.dumps(line) for line in lines) + "\n")
+        try:
+            records = list(iter_records(log_path))
+            result.equal([record['url'] for record in records], ['/ms', '/seconds'], "Implausible timestamps and malformed headers are skipped")
+            result.equal([record['timestamp'] for record in records], [1700000000.5, 1700000001.0], "Epoch milliseconds are detected")
+            records = list(iter_records(log_path, timestamp_unit='ms'))
+            result.equal(records[-1]['timestamp'], 1700000.001, "An explicit unit applies to every timestamp")
+        finally:
+            os.remove(log_path)
+        result.equal(replay_url('http://gw/api/', '/items/1?q=2'), 'http://gw/api/items/1?q=2', "The path prefix of the base URL is kept")
+        result.equal(replay_url('http://gw', 'http://recorded/items/1'), 'http://gw/items/1', "Recorded absolute URLs are rebased")
+        result.equal(replay_url(None, 'http://recorded/items/1'), 'http://recorded/items/1', "Without a base URL the recorded URL is used")
+
+    @testcase(name="replay_gaps_and_errors_test_case")
+    def replay_gaps_and_errors(self, env, result):
+        """
+        Replays a log with an hour-long gap and a request that cannot be encoded.
+        """
+        lines = [
+            {"timestamp": 1700000000, "path": "/first"},
+            {"timestamp": 1700003600, "path": "/after-an-hour", "headers": {"X-Currency": "\u20ac"}},
+            {"timestamp": 1700003600.1, "path": "/last"},
+        ]
+        fd, log_path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(fd, 'w') as f:
+            f.write("\n".join(json.dumps(line) for line in lines) + "\n")
+        testcase_params = {"replay_log": log_path, "replay_base_url": self.stub_server.url, "replay_max_gap": 0.2}
+        test_orchestrator = TestOrchestrator(['replay_traffic'], testcase_params)
+        try:
+            summary = test_orchestrator.execute_test()[0]
+            result.log(str(summary))
+            result.equal(summary['requests'], 3, "A request that fails before it is sent is still counted")
+            result.equal(summary['errors'], 1, "The header that cannot be encoded counts as an error")
+            result.equal(summary['shortened_gaps'], 1, "The hour-long gap was shortened")
+            result.less(summary['duration'], 5.0, "The replay did not wait for an hour")
+        except RuntimeError as e:
+            result.fail(f"Test failed: {e}")
+        finally:
+            os.remove(log_path)
+
+
+
+@testsuite(name="Graph and Report Stages")
+class ReportingSuite:
+    exclusive = True  # Aggregates a million samples and asserts on how long that takes
+
+    def __init__(self):
+        self.sample_count = 1000000
+        self.work_dir = None
+
+    def setup(self, env):
+        # One million synthetic samples over 10 minutes with exponential latencies (mean 50ms) and 1% errors
+        self.work_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        samples = make_samples(
+            ['login', 'search', 'checkout'],
+            rng.integers(0, 3, self.sample_count),
+            1700000000 + np.sort(rng.random(self.sample_count) * 600),
+            rng.exponential(0.05, self.sample_count),
+            rng.random(self.sample_count) > 0.01,
+        )
+        save_samples(os.path.join(self.work_dir, 'samples.npz'), samples)
+
+    def teardown(self, env):
+        shutil.rmtree(self.work_dir)
+
+    @testcase(name="graph_and_report_test_case")
+    def graph_and_report(self, env, result):
+        """
+        Renders charts and a report from the stage timings and the recorded samples.
+        """
+        print("*********** Running graph and report test case...")
+        testcase_params = {
+            "file_path": "my_file.txt",
+            "samples_path": os.path.join(self.work_dir, 'samples.npz'),
+            "report_dir": self.work_dir,
+            "graph_type": "all",
+            "report_type": "micro",
+        }
+        test_orchestrator = TestOrchestrator(['read_file', 'graph_stage', 'report_stage'], testcase_params)
+        try:
+            results = test_orchestrator.execute_test()
+            result.log(str(results))
+            for chart in ('latency_percentiles.png', 'throughput.png'):
+                result.true(os.path.exists(os.path.join(self.work_dir, chart)), f"{chart} was rendered")
+            with open(os.path.join(self.work_dir, 'report_micro.json'), 'r') as f:
+                report = json.load(f)
+            requests_report = report['request_samples']
+            result.equal(sorted(requests_report['stages']), ['checkout', 'login', 'search'], "Per-stage breakdown was reported")
+            result.equal(requests_report['samples'], self.sample_count, "Stage timings are kept out of the request samples")
+            result.equal(sorted(report['stage_timings']['stages']), ['graph_stage', 'read_file'], "Stage timings are reported separately")
+            result.less(abs(requests_report['overall']['p50_ms'] - 34.66), 1.0, "Median latency matches the sample distribution")
+            # One million samples over 600s
+            result.less(abs(requests_report['overall']['throughput'] - self.sample_count / 600), 20, "Throughput spans the sampled period")
+            timeline = requests_report['timeline']
+            result.equal(requests_report['window'], 1.0, "Throughput is windowed per second")
+            result.equal(len(timeline['throughput']), 600, "The timeline covers the sampled period")
+            result.greater(min(timeline['throughput']), 1000, "Every window carries traffic")
+            result.less(test_orchestrator._stage_records[-1]['duration'], 10.0, "One million samples were reported within seconds")
         except RuntimeError as e:
-            result.fail(f"Test failed: {e}")
\ No newline at end of file
+            result.fail(f"Test failed: {e}")
+
+
+# A trimmed testplan JSON report: run timers as a single interval or a list of intervals, stamped with
+# ISO 8601 strings or epoch seconds (all occur depending on the testplan version), one testcase that
+# never finished and a synthesized suite setup that must not be recorded
+SHARDING_REPORT = {
+    "name": "My Test Plan",
+    "entries": [{
+        "category": "multitest",
+        "name": "Environment Setup 1",
+        "entries": [
+            {"category": "testsuite", "name": "SuiteA", "entries": [
+                {"type": "TestCaseReport", "name": "a1",
+                 "timer": {"run": {"start": "2024-01-01T00:00:00+00:00", "end": "2024-01-01T00:00:50+00:00"}}},
+                {"type": "TestCaseReport", "name": "a2",
+                 "timer": {"run": {"start": "2024-01-01T00:01:00+00:00", "end": None}}},
+            ]},
+            {"category": "testsuite", "name": "SuiteB", "entries": [
+                {"category": "synthesized", "type": "TestCaseReport", "name": "setup",
+                 "timer": {"run": [{"start": 1704067200.0, "end": 1704067205.0}]}},
+                {"category": "parametrization", "name": "b", "entries": [
+                    {"type": "TestCaseReport", "name": "b1",
+                     "timer": {"run": [{"start": "2024-01-01T00:00:00+00:00", "end": "2024-01-01T00:00:20+00:00"},
+                                       {"start": "2024-01-01T00:01:00+00:00", "end": "2024-01-01T00:01:10+00:00"}]}},
+                ]},
+                {"category": "testcase", "type": "TestCaseReport", "name": "b2",
+                 "timer": {"run": [{"start": 1704067200.0, "end": 1704067212.5}]}},
+            ]},
+        ],
+    }],
+}
+
+
+def _fake_suite(name: str, testcases: list):
+    """
+    Builds a class that looks like a testplan testsuite to the sharding helpers.
+    """
+    def make_testcase(testcase_name):
+        def run(self, env, result):
+            pass
+        run.__testcase__ = True
+        run.name = testcase_name
+        return run
+    return type(name, (), {testcase_name: make_testcase(testcase_name) for testcase_name in testcases})
+
+
+def _fake_parametrized_suite(name: str, template: str, generated: list):
+    """
+    Builds a class that looks like a testsuite with one parametrized testcase: the template and the
+    testcases testplan generates from it.
+    """
+    def run(self, env, result):
+        pass
+    run.__parametrization_template__ = True
+    run.name = template
+    attributes = {template: run}
+    for generated_name in generated:
+        def run_generated(self, env, result):
+            pass
+        run_generated.__testcase__ = True
+        run_generated.name = generated_name
+        run_generated._parametrization_template = template
+        attributes[generated_name] = run_generated
+    return type(name, (), attributes)
+
+
+@testsuite(name="Duration-aware Sharding")
+class ShardingSuite:
+    def __init__(self):
+        self.work_dir = None
+
+    def setup(self, env):
+        self.work_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.work_dir, 'report.json'), 'w') as f:
+            json.dump(SHARDING_REPORT, f)
+
+    def teardown(self, env):
+        shutil.rmtree(self.work_dir)
+
+    def _store(self, name: str) -> DurationStore:
+        return DurationStore(os.path.join(self.work_dir, name), smoothing=0.5, default_seconds=30.0)
+
+    @testcase(name="update_from_report_test_case")
+    def update_from_report(self, env, result):
+        store = self._store('from_report.json')
+        recorded = store.update_from_report(os.path.join(self.work_dir, 'report.json'))
+        result.equal(recorded, 3, "Finished testcases of every timer shape were recorded")
+        reloaded = self._store('from_report.json')
+        result.equal(reloaded.estimate('SuiteA', ['a1']), 50.0, "A single run interval is recorded")
+        result.equal(reloaded.estimate('SuiteB', ['b1']), 30.0, "A list of run intervals is summed")
+        result.equal(reloaded.estimate('SuiteB', ['b2']), 12.5, "Epoch second timestamps are recorded")
+        result.equal(reloaded.estimate('SuiteB'), 42.5, "Synthesized setup entries are not recorded")
+
+    @testcase(name="ewma_recording_test_case")
+    def ewma_recording(self, env, result):
+        store = self._store('ewma.json')
+        store.record('SuiteA', 'a1', 10.0)
+        store.record('SuiteA', 'a1', 20.0)
+        result.equal(store.estimate('SuiteA', ['a1']), 15.0, "The second observation is averaged in")
+
+    @testcase(name="fallback_estimate_test_case")
+    def fallback_estimate(self, env, result):
+        store = self._store('fallback.json')
+        new_suite = _fake_suite('SuiteC', ['c1', 'c2'])
+        result.equal(store.estimate('SuiteC', testcase_names(new_suite)), 60.0, "Without history every testcase gets the default")
+        store.record('SuiteA', 'a1', 10.0)
+        store.record('SuiteB', 'b1', 30.0)
+        result.equal(store.estimate('SuiteA', ['a1', 'a_new']), 30.0, "A new testcase in a known suite gets the median")
+        result.equal(store.estimate('SuiteC', ['c1', 'c2']), 40.0, "A new suite is estimated per testcase")
+
+    @testcase(name="lpt_balance_test_case")
+    def lpt_balance(self, env, result):
+        store = self._store('lpt.json')
+        durations = {'SuiteA': 50.0, 'SuiteB': 30.0, 'SuiteC': 40.0, 'SuiteD': 20.0, 'SuiteE': 10.0}
+        suites = []
+        for name, seconds in durations.items():
+            store.record(name, 'only', seconds)
+            suites.append(_fake_suite(name, ['only']))
+        shards = shard_suites(suites, 2, store)
+        loads = [sum(durations[suite.__name__] for suite in shard) for shard in shards]
+        result.equal([[suite.__name__ for suite in shard] for shard in shards],
+                     [['SuiteA', 'SuiteD', 'SuiteE'], ['SuiteC', 'SuiteB']], "Suites are placed longest first on the least loaded shard")
+        result.equal(loads, [80.0, 70.0], "Shards are balanced")
+        result.equal(len(shard_suites(suites[:1], 4, store)), 1, "Empty shards are dropped")
+
+    @testcase(name="parametrized_estimate_test_case")
+    def parametrized_estimate(self, env, result):
+        store = self._store('parametrized.json')
+        store.record('SuiteP', 'load <users=1>', 5.0)
+        store.record('SuiteP', 'load <users=10>', 15.0)
+        store.record('SuiteP', 'smoke', 1.0)
+        suite = _fake_parametrized_suite('SuiteP', 'load', ['load <users=1>', 'load <users=10>'])
+        result.equal(testcase_names(suite), ['load'], "A parametrized testcase is named once, by its template")
+        result.equal(store.estimate('SuiteP', testcase_names(suite)), 20.0, "The generated testcases are summed")
+
+    @testcase(name="exclusive_shards_test_case")
+    def exclusive_shards(self, env, result):
+        store = self._store('exclusive.json')
+        suites = [_fake_suite(name, ['only']) for name in ('SuiteA', 'SuiteB', 'SuiteC')]
+        suites[1].exclusive = True
+        shards = shard_suites(suites, 4, store)
+        result.equal([[suite.__name__ for suite in shard] for shard in shards],
+                     [['SuiteB'], ['SuiteA'], ['SuiteC']], "An exclusive suite gets a shard of its own")
+
+        gate, events = ShardGate(), []
+        gate.acquire()
+        waiting = threading.Thread(target=lambda: (gate.acquire(exclusive=True), events.append('exclusive'),
+                                                   gate.release(exclusive=True)))
+        waiting.start()
+        time.sleep(0.1)
+        events.append('shared')
+        gate.release()
+        waiting.join(5)
+        result.equal(events, ['shared', 'exclusive'], "An exclusive shard waits for the running shards")
+
+
+# All suites of the plan, keyed by class name so pool tasks can rebuild them by name
+SUITES = {
+    suite.__name__: suite for suite in (
+        PerformanceTestSuite,
+        RecoveryTestSuite,
+        StageExecutionSuite,
+        UnregisteredStageExecutionSuite,
+        GraphStageExecutionSuite,
+        ReportStageExecutionSuite,
+        CapacitySearchSuite,
+        ReplayTrafficSuite,
+        ReportingSuite,
+        ShardingSuite,
+    )
+}
+
+
+# Shards run on the threads of one pool; exclusive shards must not share the process with any other
+SHARD_GATE = ShardGate()
+
+
+def _start_shared_shard(env):
+    """Waits until no exclusive shard is running."""
+    SHARD_GATE.acquire()
+
+
+def _stop_shared_shard(env):
+    SHARD_GATE.release()
+
+
+def _start_exclusive_shard(env):
+    """Waits until no other shard is running."""
+    SHARD_GATE.acquire(exclusive=True)
+
+
+def _stop_exclusive_shard(env):
+    SHARD_GATE.release(exclusive=True)
+
+
+def make_shard_multitest(name: str, suite_names: list, exclusive: bool = False):
+    """
+    Builds the MultiTest of one shard. Used as the target of the pool tasks scheduled by the test plan.
+    :param name: The MultiTest name.
+    :param suite_names: Class names of the suites in the shard.
+    :param exclusive: Whether the shard runs without any other shard alongside it.
+    """
+    if exclusive:
+        before_start, after_stop = _start_exclusive_shard, _stop_exclusive_shard
+    else:
+        before_start, after_stop = _start_shared_shard, _stop_shared_shard
+    return MultiTest(name=name, suites=[SUITES[suite_name]() for suite_name in suite_names],
+                     before_start=before_start, after_stop=after_stop)